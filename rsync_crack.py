@@ -1,11 +1,21 @@
+import asyncio
 import subprocess
 import argparse
 import logging
+import re
+import shutil
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from tqdm import tqdm
 import time
 import json
 import csv
+import itertools
+import queue
+import sqlite3
+import pickle
 
 # 配置日志
 logging.basicConfig(
@@ -14,6 +24,26 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 单次 --files-from 批量探测的候选数上限
+BATCH_SIZE = 256
+
+# 每个worker攒多少次完成才刷新一次进度条
+PBAR_FLUSH = 32
+
+# 探测失败（超时/连接错误等）的哨兵值，区别于"确认不存在"的None；
+# 失败的探测不写入缓存和阴性过滤器，避免污染后续运行
+PROBE_ERROR = object()
+
+# 启动时把rsync解析成绝对路径：CPython只在可执行文件自带目录时
+# 才走posix_spawn快速路径，裸名仍会退回fork+exec；
+# 未安装时保留裸名，由各调用点按FileNotFoundError报错
+RSYNC_BIN = shutil.which('rsync') or 'rsync'
+
+# 固定的argv前缀提到模块级，热路径上只拼接URL一项
+RSYNC_LIST_ARGV = (RSYNC_BIN, '-av', '--list-only')
+RSYNC_BATCH_ARGV = (RSYNC_BIN, '-av', '--list-only', '--files-from=-')
+RSYNC_DOWNLOAD_ARGV = (RSYNC_BIN, '-av')
+
 def run_rsync(target_ip, path, port=873, timeout=None, verbose=False):
     """
     执行rsync命令以列出目录/文件。
@@ -24,14 +54,21 @@ def run_rsync(target_ip, path, port=873, timeout=None, verbose=False):
         port (int): rsync端口号。
         timeout (float): 命令执行超时时间（秒）。
         verbose (bool): 是否打印调试信息。
+
+    Returns:
+        str: 列表输出（命中）；None表示确认不存在；
+             PROBE_ERROR表示探测失败，结果不可信。
     """
-    rsync_command = f'rsync -av --list-only rsync://{target_ip}:{port}/{path}'
+    # 直接以argv列表执行，省去每次探测多fork一个/bin/sh，
+    # 也避免字典中的shell元字符被解释
+    rsync_command = [*RSYNC_LIST_ARGV, f'rsync://{target_ip}:{port}/{path}']
     if verbose:
-        logger.debug(f"执行命令: {rsync_command}")
+        logger.debug("执行命令: %s", ' '.join(rsync_command))
     try:
         result = subprocess.run(
             rsync_command,
-            shell=True,
+            shell=False,
+            close_fds=False,
             check=True,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
@@ -42,25 +79,319 @@ def run_rsync(target_ip, path, port=873, timeout=None, verbose=False):
             return result.stdout.strip()
         return None
     except subprocess.CalledProcessError as e:
-        logger.error(f"运行rsync枚举命令失败: {e.stderr.strip()}")
-        return None
+        logger.error("运行rsync枚举命令失败: %s", e.stderr.strip())
+        # 5=无法启动协议（模块不存在）、23/24=部分传输（路径不存在）
+        # 是确认阴性；其余退出码（网络I/O错误等）视为探测失败
+        return None if e.returncode in (5, 23, 24) else PROBE_ERROR
+    except subprocess.TimeoutExpired:
+        logger.error("运行rsync超时: %s", path)
+        return PROBE_ERROR
+    except FileNotFoundError:
+        logger.error("未找到rsync命令，请先安装rsync。")
+        return PROBE_ERROR
+
+def run_rsync_batch(target_ip, module, rel_paths, port=873, timeout=None, verbose=False):
+    """
+    在单个rsync连接上批量列出同一模块下的多个候选路径。
+
+    通过 --files-from=- 把整批相对路径经stdin交给一次rsync调用，
+    将 len(rel_paths) 次TCP连接+握手摊薄成一次。
+
+    Args:
+        target_ip (str): 目标IP地址。
+        module (str): 模块名（候选路径的顶层前缀）。
+        rel_paths (list): 模块内的相对路径列表。
+        port (int): rsync端口号。
+        timeout (float): 命令执行超时时间（秒）。
+        verbose (bool): 是否打印调试信息。
+
+    Returns:
+        list: 命中的完整路径（module/相对路径 形式）；
+              None表示探测失败，整批结果不可信。
+    """
+    rsync_command = [*RSYNC_BATCH_ARGV, f'rsync://{target_ip}:{port}/{module}']
+    if verbose:
+        logger.debug("执行批量命令: %s (%d 条)", ' '.join(rsync_command), len(rel_paths))
+    try:
+        # 部分候选不存在时rsync会以非零退出，但仍列出存在的条目，故不check
+        result = subprocess.run(
+            rsync_command,
+            shell=False,
+            close_fds=False,
+            input="\n".join(rel_paths) + "\n",
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=timeout
+        )
     except subprocess.TimeoutExpired:
-        logger.error(f"运行rsync超时: {path}")
+        logger.error("批量探测超时: 模块 %s", module)
+        return None
+    except FileNotFoundError:
+        logger.error("未找到rsync命令，请先安装rsync。")
+        return None
+
+    # 0=全部命中、5=模块不存在、23/24=部分路径不存在都算正常完成；
+    # 其余退出码说明这次调用本身失败了
+    if result.returncode not in (0, 5, 23, 24):
+        logger.error("批量探测失败: 模块 %s: %s", module, result.stderr.strip())
+        return None
+
+    rel_set = set(rel_paths)
+    hits = []
+    for line in result.stdout.splitlines():
+        # --list-only 输出格式: 权限 大小 日期 时间 名称
+        parts = line.split(None, 4)
+        if len(parts) != 5:
+            continue
+        # 符号链接的名称字段形如 "name -> target"，先剥掉指向部分
+        name = parts[4].split(' -> ', 1)[0]
+        if name in rel_set:
+            hits.append(f"{module}/{name}")
+    return hits
+
+def build_exclude_matcher(exclude):
+    """
+    把排除列表预编译成单次线性扫描的匹配器。
+
+    优先使用pyahocorasick自动机；未安装时退化为一次性编译的
+    正则交替，仍是每个词一次C级扫描，而非对每个排除项做Python
+    层的`in`判断。
+
+    Returns:
+        callable: word -> bool（是否命中排除项），无排除项时为None。
+    """
+    if not exclude:
         return None
+    try:
+        import ahocorasick
+    except ImportError:
+        pattern = re.compile('|'.join(map(re.escape, exclude)))
+        return lambda word: pattern.search(word) is not None
+    automaton = ahocorasick.Automaton()
+    for index, ex in enumerate(exclude):
+        automaton.add_word(ex, index)
+    automaton.make_automaton()
+    return lambda word: next(automaton.iter(word), None) is not None
+
+def group_paths_by_module(paths):
+    """
+    按模块前缀对候选路径分组，便于批量探测。
+
+    Returns:
+        tuple: (模块 -> 相对路径列表 的字典, 不含子路径的裸模块候选列表)
+    """
+    groups = {}
+    singles = []
+    for path in paths:
+        module, sep, rest = path.partition('/')
+        if sep and rest:
+            groups.setdefault(module, []).append(rest)
+        else:
+            singles.append(path)
+    return groups, singles
+
+def list_modules(target_ip, port=873, timeout=5, verbose=False):
+    """
+    通过一次 #list 请求获取守护进程公开的模块名集合。
+
+    字典里大量候选属于根本不存在的顶层模块，先拿到公开模块
+    列表就能把它们整批判负，一次banner读取顶替N次完整握手。
+
+    Returns:
+        set: 模块名集合；连接失败或目标禁用 #list 时返回None，
+             调用方此时不做任何模块预过滤。MOTD与模块列表之间
+             的空行用于剔除MOTD文本；个别不输出该空行的实现会
+             让集合偏大，只会放过候选，不会错误跳过。
+    """
+    try:
+        s = socket.create_connection((target_ip, port), timeout=timeout)
+    except OSError as e:
+        logger.error(f"获取模块列表失败 {target_ip}:{port}: {e}")
+        return None
+
+    data = b""
+    try:
+        s.settimeout(timeout)
+        s.sendall(b"@RSYNCD: 31.0\n#list\n")
+        while True:
+            try:
+                chunk = s.recv(8192)
+            except socket.timeout:
+                break
+            if not chunk:
+                break
+            data += chunk
+    except OSError:
+        pass
+    finally:
+        s.close()
+
+    modules = set()
+    for line in data.decode(errors='replace').splitlines():
+        if line.startswith(('@RSYNCD:', '@ERROR')):
+            continue
+        if not line.strip():
+            # 守护进程会在MOTD之后输出一个空行，模块列表在其后；
+            # 空行之前收集到的都是MOTD文本，丢弃
+            modules.clear()
+            continue
+        # 列表行格式: 模块名[<tab或空白>注释]
+        modules.add(line.split(None, 1)[0])
+    if verbose:
+        logger.debug(f"目标公开模块: {', '.join(sorted(modules)) if modules else '无'}")
+    return modules or None
+
+async def probe_rsync_native(target_ip, path, port=873, timeout=None, verbose=False):
+    """
+    直接使用rsync守护进程协议探测模块是否存在，无需派生rsync子进程。
+
+    只完成文本握手阶段：发送协议版本、请求模块名，根据守护进程的
+    应答（@RSYNCD: OK / AUTHREQD 表示存在，@ERROR 表示不存在）判断结果。
+    对于带子路径的候选，这里只探测其顶层模块部分，
+    模块命中后子路径是否存在需由调用方另行确认。
+
+    Args:
+        target_ip (str): 目标IP地址。
+        path (str): 要枚举的路径。
+        port (int): rsync端口号。
+        timeout (float): 单次读写超时时间（秒）。
+        verbose (bool): 是否打印调试信息。
+
+    Returns:
+        str: 应答摘要（模块存在）；None表示确认不存在；
+             PROBE_ERROR表示连接失败或超时，结果不可信。
+    """
+    module = path.split('/', 1)[0]
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(target_ip, port), timeout)
+    except (OSError, asyncio.TimeoutError) as e:
+        logger.error("连接rsync守护进程失败 %s:%s: %s", target_ip, port, e)
+        return PROBE_ERROR
+
+    try:
+        if verbose:
+            logger.debug("原生探测模块: %s", module)
+        writer.write(b"@RSYNCD: 31.0\n")
+        await writer.drain()
+        greeting = await asyncio.wait_for(reader.readline(), timeout)
+        if not greeting.startswith(b"@RSYNCD:"):
+            return None
+        writer.write(module.encode() + b"\n")
+        await writer.drain()
+        lines = []
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            if not line:
+                break
+            line = line.rstrip(b"\n")
+            if line.startswith(b"@ERROR"):
+                return None
+            if line.startswith(b"@RSYNCD: EXIT"):
+                break
+            lines.append(line)
+            if line.startswith((b"@RSYNCD: OK", b"@RSYNCD: AUTHREQD")):
+                break
+        if any(l.startswith((b"@RSYNCD: OK", b"@RSYNCD: AUTHREQD")) for l in lines):
+            return b"\n".join(lines).decode(errors='replace') or "OK"
+        return None
+    except (OSError, asyncio.TimeoutError):
+        logger.error("原生探测超时或连接中断: %s", path)
+        return PROBE_ERROR
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+async def enumerate_native(target_ip, paths, port, timeout, verbose, concurrency, token_bucket, handle_hit, pbar, cache=None, bloom=None, known_modules=None, adaptive=None):
+    """
+    基于asyncio事件循环并发驱动原生协议探测。
+
+    候选从生成器流式送入有界队列，由固定数量的worker消费，
+    不在内存中物化完整候选列表；命中后的处理（日志/下载）
+    仍走阻塞逻辑，放到线程中执行。
+    """
+    work = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def worker():
+        # 进度攒够一批再刷，减少高速率下进度条的格式化开销
+        pending_updates = 0
+
+        def tick():
+            nonlocal pending_updates
+            pending_updates += 1
+            if pending_updates >= PBAR_FLUSH:
+                pbar.update(pending_updates)
+                pending_updates = 0
+
+        while True:
+            path = await work.get()
+            if path is None:
+                break
+            if known_modules is not None and path.split('/', 1)[0] not in known_modules:
+                tick()
+                continue
+            if bloom is not None and path in bloom:
+                tick()
+                continue
+            cached = cache.get(target_ip, port, path) if cache else None
+            if cached is not None:
+                if cached:
+                    await asyncio.to_thread(handle_hit, path)
+                tick()
+                continue
+            await token_bucket.acquire_async()
+            probe_timeout = adaptive.current() if adaptive else timeout
+            start = time.perf_counter()
+            output = await probe_rsync_native(target_ip, path, port, probe_timeout, verbose)
+            if output is not PROBE_ERROR:
+                if adaptive and output:
+                    adaptive.observe(time.perf_counter() - start)
+                if output and '/' in path:
+                    # 原生握手只证明模块存在；带子路径的候选还要
+                    # 用rsync列表确认子路径本身，避免把模块命中
+                    # 误报成文件命中
+                    output = await asyncio.to_thread(
+                        run_rsync, target_ip, path, port, probe_timeout, verbose)
+            if output is PROBE_ERROR:
+                # 探测失败不是阴性，跳过缓存与过滤器写入
+                tick()
+                continue
+            if cache:
+                cache.put(target_ip, port, path, bool(output))
+            if bloom is not None and not output:
+                bloom.add(path)
+            if output:
+                await asyncio.to_thread(handle_hit, path)
+            tick()
+        if pending_updates:
+            pbar.update(pending_updates)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    for path in paths:
+        await work.put(path)
+    for _ in workers:
+        await work.put(None)
+    await asyncio.gather(*workers)
 
-def download_rsync(target_ip, path, port=873, timeout=None, verbose=False):
+def download_rsync(target_ip, path, download_dir, port=873, timeout=None, verbose=False):
     """
     使用rsync下载指定路径。
+
+    download_dir 由调用方启动时创建一次并传入，
+    不在每次下载时重复stat+mkdir。
     """
-    download_dir = Path("downloads")
-    download_dir.mkdir(exist_ok=True)
-    download_command = f'rsync -av rsync://{target_ip}:{port}/{path} {download_dir}/'
+    download_command = [*RSYNC_DOWNLOAD_ARGV, f'rsync://{target_ip}:{port}/{path}', f'{download_dir}/']
     if verbose:
-        logger.debug(f"执行命令: {download_command}")
+        logger.debug(f"执行命令: {' '.join(download_command)}")
     try:
         subprocess.run(
             download_command,
-            shell=True,
+            shell=False,
+            close_fds=False,
             check=True,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
@@ -72,55 +403,325 @@ def download_rsync(target_ip, path, port=873, timeout=None, verbose=False):
         logger.error(f"下载失败 {path}: {e.stderr.strip()}")
     except subprocess.TimeoutExpired:
         logger.error(f"下载操作超时: {path}")
+    except FileNotFoundError:
+        logger.error("未找到rsync命令，请先安装rsync。")
 
-def save_results(found_paths, output_file, output_format):
+def download_rsync_batch(target_ip, module, rel_paths, download_dir, port=873, timeout=None, verbose=False):
     """
-    将发现的路径保存到文件中，支持多种格式: plain/csv/json。
+    通过一次rsync连接批量下载同一模块下的多个命中路径。
 
-    Args:
-        found_paths (list): 发现的路径列表。
-        output_file (str): 输出文件名。
-        output_format (str): 输出格式（plain/csv/json）。
-    """
-    if not output_file:
-        return
-
-    if output_format == 'plain':
-        with open(output_file, 'w') as out_file:
-            for path in found_paths:
-                out_file.write(f"{path}\n")
-    elif output_format == 'csv':
-        with open(output_file, 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(["Path"])
-            for path in found_paths:
-                writer.writerow([path])
-    elif output_format == 'json':
-        with open(output_file, 'w') as out_file:
-            json.dump({"found_paths": found_paths}, out_file, indent=4)
-    else:
-        logger.error(f"不支持的输出格式: {output_format}")
-
-    logger.info(f"\n已保存发现的路径到 {output_file}")
-
-def main(target_ip, wordlist_file, extensions, output_file, download, port, exclude, down_rs_timeout, down_rs_delay, output_format, verbose):
+    与逐条调用download_rsync相比，K个命中只建立一次连接，
+    省去K-1次TCP+握手往返。基础下载目录由调用方创建一次传入，
+    这里只为新出现的模块建子目录。
+    """
+    module_dir = download_dir / module
+    module_dir.mkdir(exist_ok=True)
+    download_command = [*RSYNC_DOWNLOAD_ARGV, '--files-from=-', f'rsync://{target_ip}:{port}/{module}/', f'{module_dir}/']
+    if verbose:
+        logger.debug(f"执行批量下载命令: {' '.join(download_command)} ({len(rel_paths)} 条)")
+    try:
+        subprocess.run(
+            download_command,
+            shell=False,
+            close_fds=False,
+            check=True,
+            input="\n".join(rel_paths) + "\n",
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=timeout
+        )
+        logger.info(f"批量下载成功: {module} ({len(rel_paths)} 条)")
+    except subprocess.CalledProcessError as e:
+        logger.error(f"批量下载失败 {module}: {e.stderr.strip()}")
+    except subprocess.TimeoutExpired:
+        logger.error(f"批量下载超时: 模块 {module}")
+    except FileNotFoundError:
+        logger.error("未找到rsync命令，请先安装rsync。")
+
+class ProbeCache:
+    """
+    基于sqlite3的探测结果缓存，跨运行复用。
+
+    以(target_ip, port, path)为键记录上次探测结果与时间戳，
+    TTL内的重复候选直接命中缓存，完全跳过网络探测；
+    写入先进内存缓冲，攒够一批再executemany落盘，
+    避免每次探测都阻塞在磁盘I/O上。
+    """
+
+    FLUSH_THRESHOLD = 128
+
+    def __init__(self, cache_file, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._pending = []
+        self._conn = sqlite3.connect(cache_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS probes ("
+            "target TEXT, port INTEGER, path TEXT, exists_flag INTEGER, ts REAL, "
+            "PRIMARY KEY (target, port, path))")
+        self._conn.commit()
+
+    def get(self, target, port, path):
+        """查询缓存，返回True/False，过期或未记录返回None。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT exists_flag, ts FROM probes WHERE target=? AND port=? AND path=?",
+                (target, port, path)).fetchone()
+        if row is None:
+            return None
+        exists_flag, ts = row
+        if time.time() - ts > self.ttl:
+            return None
+        return bool(exists_flag)
+
+    def put(self, target, port, path, exists):
+        with self._lock:
+            self._pending.append((target, port, path, int(exists), time.time()))
+            if len(self._pending) >= self.FLUSH_THRESHOLD:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?)", self._pending)
+        self._conn.commit()
+        self._pending.clear()
+
+    def close(self):
+        with self._lock:
+            if self._pending:
+                self._flush_locked()
+            self._conn.close()
+
+class AdaptiveTimeout:
+    """
+    基于成功探测时延EWMA的自适应超时（Jacobson算法）。
+
+    维护RTT的指数滑动均值与偏差，超时取 ewma + 4*var，
+    夹在[0.5, 用户--timeout]之间。死候选在约2×RTT内失败，
+    不再等满保守的静态超时；慢目标则自动放宽。
+    """
+
+    ALPHA = 0.125
+    BETA = 0.25
+    FLOOR = 0.5
+
+    def __init__(self, user_max):
+        self.user_max = user_max or 30.0
+        self._lock = threading.Lock()
+        self._ewma = None
+        self._var = 0.0
+
+    def current(self):
+        """取当前自适应超时值（秒）。"""
+        with self._lock:
+            if self._ewma is None:
+                return self.user_max
+            return min(self.user_max, max(self.FLOOR, self._ewma + 4 * self._var))
+
+    def observe(self, rtt):
+        """用一次成功探测的实测时延更新估计。"""
+        with self._lock:
+            if self._ewma is None:
+                self._ewma = rtt
+                self._var = rtt / 2
+            else:
+                err = rtt - self._ewma
+                self._var += self.BETA * (abs(err) - self._var)
+                self._ewma += self.ALPHA * err
+
+class NegativeFilter:
+    """
+    已知不存在候选的持久化预过滤器。
+
+    重复枚举同一目标时，大部分候选是上次已确认的阴性；
+    在发起任何网络探测（甚至缓存查询）之前先过一遍布隆
+    过滤器，O(1)、零磁盘I/O地跳过它们。优先使用
+    pybloom_live的可扩展布隆过滤器，未安装时退化为普通set；
+    经pickle持久化到 ~/.cache/rsync-enum/{target}.bf。
+    """
+
+    def __init__(self, filter_file):
+        self.filter_file = Path(filter_file)
+        self._lock = threading.Lock()
+        self._filter = None
+        if self.filter_file.exists():
+            try:
+                with open(self.filter_file, 'rb') as f:
+                    self._filter = pickle.load(f)
+            except Exception:
+                logger.error(f"过滤器文件损坏，已忽略: {self.filter_file}")
+        if self._filter is None:
+            try:
+                from pybloom_live import ScalableBloomFilter
+                self._filter = ScalableBloomFilter(
+                    initial_capacity=1_000_000, error_rate=0.001)
+            except ImportError:
+                self._filter = set()
+
+    def __contains__(self, path):
+        with self._lock:
+            return path in self._filter
+
+    def add(self, path):
+        with self._lock:
+            self._filter.add(path)
+
+    def save(self):
+        self.filter_file.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            with open(self.filter_file, 'wb') as f:
+                pickle.dump(self._filter, f)
+
+class TokenBucket:
+    """
+    跨worker共享的令牌桶限速器。
+
+    以 1/delay 的速率补充令牌，每次探测前扣除一个；
+    这样无论并发多少，聚合请求速率都稳定在设定值，
+    而delay为0时acquire直接返回，完全不进临界区。
+    """
+
+    def __init__(self, delay):
+        self.rate = (1.0 / delay) if delay else 0.0
+        # 允许约1秒配额的突发，避免启动时人为空等
+        self.capacity = max(self.rate, 1.0)
+        self.tokens = self.capacity
+        self._ts = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """扣除一个令牌，返回补足所需等待的秒数。"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self._ts) * self.rate)
+            self._ts = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        if not self.rate:
+            return
+        wait_for = self._reserve()
+        if wait_for > 0:
+            time.sleep(wait_for)
+
+    async def acquire_async(self):
+        if not self.rate:
+            return
+        wait_for = self._reserve()
+        if wait_for > 0:
+            await asyncio.sleep(wait_for)
+
+class ResultSink:
+    """
+    增量写出命中结果的流式输出，支持多种格式: plain/csv/json。
+
+    输出文件在枚举开始时打开（行缓冲、追加模式），每个命中
+    立即落盘，长时间运行中途中断也不丢已有结果；json格式写成
+    每行一条的NDJSON，天然支持追加。
+    """
+
+    def __init__(self, output_file, output_format):
+        self.output_file = output_file
+        self.output_format = output_format
+        self._lock = threading.Lock()
+        self._file = open(output_file, 'a', buffering=1, newline='' if output_format == 'csv' else None)
+        self._csv_writer = None
+        if output_format == 'csv':
+            self._csv_writer = csv.writer(self._file)
+            if self._file.tell() == 0:
+                self._csv_writer.writerow(["Path"])
+        # 编码器复用一份，紧凑分隔符走C加速路径，不转义非ASCII
+        self._encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+
+    def write(self, path):
+        with self._lock:
+            if self.output_format == 'csv':
+                self._csv_writer.writerow([path])
+            elif self.output_format == 'json':
+                self._file.write(self._encoder.encode({"path": path}) + '\n')
+            else:
+                self._file.write(f"{path}\n")
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+def main(target_ip, wordlist_file, extensions, output_file, download, port, exclude, down_rs_timeout, down_rs_delay, output_format, verbose, concurrency=16, native=True, cache_ttl=3600, use_cache=True, use_bloom=False, assume_modules=None, adaptive_timeout=False):
     # 调整日志级别
     if verbose:
         logger.setLevel(logging.DEBUG)
 
+    sink = None
+    cache = None
+    bloom = None
+
     try:
-        with open(wordlist_file, 'r') as file:
-            words = file.read().splitlines()
+        if output_file:
+            try:
+                sink = ResultSink(output_file, output_format)
+            except OSError as e:
+                logger.error(f"无法打开输出文件 '{output_file}': {e}")
+                return
 
-        # 过滤掉需要排除的关键字
+        cache_dir = Path.home() / ".cache" / "rsync-enum"
+        if use_cache:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            cache = ProbeCache(str(cache_dir / "probes.db"), cache_ttl)
+        if use_bloom:
+            bloom = NegativeFilter(cache_dir / f"{target_ip}.bf")
+
+        is_excluded = build_exclude_matcher(exclude)
+
+        def iter_words():
+            # 流式读取字典，避免把整个文件物化成list
+            with open(wordlist_file, 'r') as f:
+                for line in f:
+                    word = line.rstrip('\n')
+                    if word and not (is_excluded and is_excluded(word)):
+                        yield word
+
+        # 扩展名元组只构造一次；word+ext 的普通拼接比每次格式化f-string更省
+        exts = tuple(extensions) if extensions else ("",)
+
+        def iter_paths():
+            # 展平成单一迭代器，主循环不再按有无扩展名分支
+            return itertools.chain.from_iterable(
+                (word + ext for ext in exts) for word in iter_words())
+
+        # 先做一次廉价的计数扫描，供进度条总数与过滤统计使用
+        kept_count = 0
+        filtered_count = 0
+        with open(wordlist_file, 'r') as f:
+            for line in f:
+                word = line.rstrip('\n')
+                if not word:
+                    continue
+                if is_excluded and is_excluded(word):
+                    filtered_count += 1
+                else:
+                    kept_count += 1
         if exclude:
-            original_count = len(words)
-            words = [w for w in words if all(ex not in w for ex in exclude)]
-            filtered_count = len(words)
-            logger.info(f"已过滤 {original_count - filtered_count} 条与排除列表匹配的条目.")
+            logger.info(f"已过滤 {filtered_count} 条与排除列表匹配的条目.")
+
+        # 去重：拼接字典后重复候选很常见，dict.fromkeys保序去重，
+        # 每个候选只探测一次（代价是把候选流物化回内存）
+        raw_total = kept_count * len(exts)
+        paths = list(dict.fromkeys(iter_paths()))
+        duplicate_count = raw_total - len(paths)
+        if duplicate_count:
+            logger.info(f"已去重 {duplicate_count} 条重复候选.")
 
-        total = len(words) * (len(extensions) if extensions else 1)
-        found_paths = []
+        total = len(paths)
+        found_count = 0
+        found_lock = threading.Lock()
+        token_bucket = TokenBucket(down_rs_delay)
+        adaptive = AdaptiveTimeout(down_rs_timeout) if adaptive_timeout else None
 
         logger.info("开始进行rsync枚举...")
         logger.info(f"目标IP: {target_ip}")
@@ -133,36 +734,158 @@ def main(target_ip, wordlist_file, extensions, output_file, download, port, excl
         logger.info(f"超时时间: {down_rs_timeout if down_rs_timeout else 'NULL'}秒")
         logger.info(f"延时: {down_rs_delay if down_rs_delay else 'NULL'}秒")
         logger.info(f"输出格式: {output_format}")
+        logger.info(f"并发数: {concurrency}")
         logger.info("-" * 50)
 
-        with tqdm(total=total, desc="枚举进度", unit="个", leave=False) as pbar:
-            for word in words:
-                if extensions:
-                    for ext in extensions:
-                        path = f"{word}{ext}"
-                        output = run_rsync(target_ip, path, port, down_rs_timeout, verbose)
-                        if output:
-                            logger.info(f"  [+] 发现: {path}")
-                            found_paths.append(path)
-                            if download:
-                                download_rsync(target_ip, path, port, down_rs_timeout, verbose)
-                        pbar.update(1)
-                        if down_rs_delay:
-                            time.sleep(down_rs_delay)
-                else:
-                    path = word
-                    output = run_rsync(target_ip, path, port, down_rs_timeout, verbose)
-                    if output:
-                        logger.info(f"  [+] 发现: {path}")
-                        found_paths.append(path)
-                        if download:
-                            download_rsync(target_ip, path, port, down_rs_timeout, verbose)
-                    pbar.update(1)
-                    if down_rs_delay:
-                        time.sleep(down_rs_delay)
-
-        if found_paths and output_file:
-            save_results(found_paths, output_file, output_format)
+        # 启动时就提示rsync缺失，而不是等到每次探测各报一遍错
+        if shutil.which('rsync') is None:
+            logger.warning("未找到rsync命令：子路径确认与下载将不可用，建议先安装rsync。")
+
+        # 先确定目标公开的模块集合，不在其中的顶层模块直接判负
+        if assume_modules:
+            known_modules = set(assume_modules)
+            logger.info(f"使用指定模块列表: {', '.join(sorted(known_modules))}")
+        else:
+            known_modules = list_modules(target_ip, port, down_rs_timeout or 5, verbose)
+            if known_modules:
+                logger.info(f"目标公开 {len(known_modules)} 个模块，其余顶层模块的候选将被跳过")
+
+        # 命中路径经队列交给单个下载线程，合并同模块的下载以复用连接
+        download_queue = queue.Queue()
+
+        def download_worker():
+            done = False
+            while not done:
+                batch = [download_queue.get()]
+                while True:
+                    try:
+                        batch.append(download_queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if None in batch:
+                    done = True
+                    batch = [p for p in batch if p is not None]
+                if not batch:
+                    break
+                groups, singles = group_paths_by_module(batch)
+                for module, rels in groups.items():
+                    download_rsync_batch(target_ip, module, rels, download_dir, port, down_rs_timeout, verbose)
+                for path in singles:
+                    download_rsync(target_ip, path, download_dir, port, down_rs_timeout, verbose)
+
+        downloader = None
+        if download:
+            # 下载目录只在启动时创建一次
+            download_dir = Path("downloads")
+            download_dir.mkdir(exist_ok=True)
+            downloader = threading.Thread(target=download_worker, daemon=True)
+            downloader.start()
+
+        def handle_hit(path):
+            nonlocal found_count
+            logger.info("  [+] 发现: %s", path)
+            with found_lock:
+                found_count += 1
+            if sink:
+                sink.write(path)
+            if download:
+                download_queue.put(path)
+
+        def probe(path):
+            if cache:
+                cached = cache.get(target_ip, port, path)
+                if cached is not None:
+                    return [path] if cached else []
+            token_bucket.acquire()
+            probe_timeout = adaptive.current() if adaptive else down_rs_timeout
+            start = time.perf_counter()
+            output = run_rsync(target_ip, path, port, probe_timeout, verbose)
+            if output is PROBE_ERROR:
+                # 探测失败不是阴性，跳过缓存与过滤器写入
+                return []
+            if adaptive and output:
+                adaptive.observe(time.perf_counter() - start)
+            if cache:
+                cache.put(target_ip, port, path, bool(output))
+            if bloom is not None and not output:
+                bloom.add(path)
+            return [path] if output else []
+
+        def probe_batch(module, rels):
+            token_bucket.acquire()
+            # 批量列表的耗时随批大小增长，不适用单次探测的RTT估计，
+            # 固定使用用户给定的超时
+            hits = run_rsync_batch(target_ip, module, rels, port, down_rs_timeout, verbose)
+            if hits is None:
+                # 整批探测失败，结果未知，不污染缓存与过滤器
+                return []
+            hit_set = set(hits)
+            for rel in rels:
+                full_path = f"{module}/{rel}"
+                if cache:
+                    cache.put(target_ip, port, full_path, full_path in hit_set)
+                if bloom is not None and full_path not in hit_set:
+                    bloom.add(full_path)
+            return hits
+
+        with tqdm(total=total, desc="枚举进度", unit="个", leave=False,
+                  mininterval=0.5, miniters=max(1, total // 1000), smoothing=0.05) as pbar:
+            if native:
+                asyncio.run(enumerate_native(
+                    target_ip, paths, port, down_rs_timeout, verbose,
+                    concurrency, token_bucket, handle_hit, pbar, cache, bloom,
+                    known_modules, adaptive))
+            else:
+                # 同一模块下的候选边读边积累成批，满BATCH_SIZE即提交；
+                # 裸模块候选逐个提交
+                pending = {}
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    try:
+                        future_counts = {}
+                        for path in paths:
+                            if known_modules is not None and path.split('/', 1)[0] not in known_modules:
+                                pbar.update(1)
+                                continue
+                            if bloom is not None and path in bloom:
+                                pbar.update(1)
+                                continue
+                            if cache:
+                                cached = cache.get(target_ip, port, path)
+                                if cached is not None:
+                                    if cached:
+                                        handle_hit(path)
+                                    pbar.update(1)
+                                    continue
+                            module, sep, rest = path.partition('/')
+                            if sep and rest:
+                                batch = pending.setdefault(module, [])
+                                batch.append(rest)
+                                if len(batch) >= BATCH_SIZE:
+                                    future = executor.submit(probe_batch, module, batch)
+                                    future_counts[future] = len(batch)
+                                    pending[module] = []
+                            else:
+                                future_counts[executor.submit(probe, path)] = 1
+                        for module, batch in pending.items():
+                            if batch:
+                                future = executor.submit(probe_batch, module, batch)
+                                future_counts[future] = len(batch)
+                        for future in as_completed(future_counts):
+                            for hit in future.result():
+                                handle_hit(hit)
+                            pbar.update(future_counts[future])
+                    except KeyboardInterrupt:
+                        # 不取消的话__exit__会等全部排队的探测跑完，
+                        # Ctrl-C形同失效；丢弃未开始的future后再退出
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        raise
+
+        if downloader:
+            download_queue.put(None)
+            downloader.join()
+
+        if sink and found_count:
+            logger.info(f"\n已保存发现的路径到 {output_file}")
 
         logger.info("\n枚举完成。")
 
@@ -172,13 +895,22 @@ def main(target_ip, wordlist_file, extensions, output_file, download, port, excl
         logger.error("用户中断操作，谢谢使用。")
     except Exception as e:
         logger.error(f"发生未知错误: {e}")
+    finally:
+        # 中断时也要把已有结果与缓存刷到磁盘
+        if sink:
+            sink.close()
+        if cache:
+            cache.close()
+        if bloom is not None:
+            bloom.save()
 
 if __name__ == "__main__":
-    logger.info("")
-    logger.info("***************************************************")
-    logger.info("         rsync 服务枚举工具 (by DingTom) v2")
-    logger.info("***************************************************")
-    logger.info("")
+    # 横幅一次性输出，避免多次经过logging格式化与handler锁
+    logger.info(
+        "\n***************************************************\n"
+        "         rsync 服务枚举工具 (by DingTom) v2\n"
+        "***************************************************\n"
+    )
 
     parser = argparse.ArgumentParser(description='Rsync 枚举工具（增强版）。')
     parser.add_argument('-t', '--target-ip', required=True, help='目标IP地址')
@@ -191,6 +923,13 @@ if __name__ == "__main__":
     parser.add_argument('--timeout', type=float, help='子进程执行超时（秒）')
     parser.add_argument('--delay', type=float, help='每次请求后的延时（秒）', default=0)
     parser.add_argument('--format', choices=['plain', 'csv', 'json'], default='plain', help='输出格式（plain/csv/json）')
+    parser.add_argument('-c', '--concurrency', type=int, default=16, help='并发探测数（默认: 16）')
+    parser.add_argument('--no-native', action='store_true', help='禁用原生协议探测，改用rsync子进程（--list-only）')
+    parser.add_argument('--cache-ttl', type=float, default=3600, help='探测结果缓存有效期（秒，默认: 3600）')
+    parser.add_argument('--no-cache', action='store_true', help='禁用探测结果缓存')
+    parser.add_argument('--use-bloom', action='store_true', help='启用已知阴性候选的持久化预过滤器')
+    parser.add_argument('--assume-modules', help='目标禁用 #list 时手动指定模块列表（逗号分隔）')
+    parser.add_argument('--adaptive-timeout', action='store_true', help='按实测时延EWMA自适应调整探测超时（--timeout作为上限）')
     parser.add_argument('--verbose', action='store_true', help='启用调试日志输出（DEBUG级别）')
 
     args = parser.parse_args()
@@ -213,5 +952,12 @@ if __name__ == "__main__":
         down_rs_timeout=down_rs_timeout,
         down_rs_delay=down_rs_delay,
         output_format=args.format,
-        verbose=args.verbose
+        verbose=args.verbose,
+        concurrency=args.concurrency,
+        native=not args.no_native,
+        cache_ttl=args.cache_ttl,
+        use_cache=not args.no_cache,
+        use_bloom=args.use_bloom,
+        assume_modules=[m for m in args.assume_modules.split(',') if m] if args.assume_modules else None,
+        adaptive_timeout=args.adaptive_timeout
     )